@@ -1,29 +1,124 @@
-import json
+import asyncio
+import atexit
 import logging
-from datetime import datetime
+import logging.handlers
+import math
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
 import uuid
-from typing import Dict, List
-from openai import OpenAI  # OpenAI SDK for Ollama-compatible interaction
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
+import httpx  # HTTP client used by the OpenAI SDK, for Ollama's native API
+import numpy as np
+import orjson  # Fast C-level JSON encoder/decoder
+import tiktoken  # Tokenizer used to budget prompt size
+from openai import AsyncOpenAI, OpenAI  # OpenAI SDK for Ollama-compatible interaction
+
+# Conversations are saved as JSON lines, one message per line, so new turns can be appended
+CONVERSATION_FILE = "conversation.jsonl"
+# Ollama's native API and its OpenAI-compatible endpoint
+OLLAMA_HOST = "http://localhost:11434"
+OLLAMA_BASE_URL = f"{OLLAMA_HOST}/v1"
+# How long Ollama keeps the chat model loaded after the warm-up request
+MODEL_KEEP_ALIVE = "30m"
+# Maximum number of requests a ChatClientPool has in flight at once (Ollama's default parallel slots)
+MAX_CONCURRENT_REQUESTS = 4
+# Maximum number of prompt tokens sent to the model (Ollama's default context window)
+CONTEXT_TOKEN_BUDGET = 2048
+# Fraction of the budget held back, since cl100k_base only approximates the model's tokenizer
+BUDGET_SAFETY_MARGIN = 0.1
+# Compaction starts over the budget but trims well below it, so it doesn't run again every turn
+COMPACTION_TARGET = int(CONTEXT_TOKEN_BUDGET * 0.55)
+# Hard cap on the history length; token-budget compaction normally keeps it well below this
+MAX_MESSAGES = 50
+# Prefix of the system message that replaces summarized turns
+SUMMARY_PREFIX = "Previous conversation summarized: "
+# Tokens kept free for that summary when retaining messages, also the summarizer's output limit
+SUMMARY_TOKEN_RESERVE = 256
+# Number of most recent messages that compaction never prunes
+RECENT_MESSAGES_KEPT = 5
+# Lines in older messages that carry no context: blank lines and conversational boilerplate
+LOW_SIGNAL_LINE_RE = re.compile(
+    r"^\s*$"
+    r"|^\s*(?:is there anything else|let me know if|i hope this helps|feel free to|happy to help)\b",
+    re.IGNORECASE,
+)
+# Weight of recency relative to query similarity when retaining messages by relevance
+RECENCY_WEIGHT = 0.3
+# User/assistant turns that are always retained at the end of the history
+PINNED_RECENT_TURNS = 2
+# Content that makes a message worth more when deciding what to retain
+CODE_OR_ERROR_RE = re.compile(r"```|\b(?:error|exception|traceback)\b", re.IGNORECASE)
+USER_CORRECTION_RE = re.compile(
+    r"^\s*(?:no\b|actually\b|wrong\b|that'?s not|that is not|i meant\b|instead\b)", re.IGNORECASE
+)
+# CLI commands, matched case-insensitively in a single scan; the group name is the command
+COMMAND_RE = re.compile(
+    r"^\s*(?:(?P<exit>exit)|(?P<save>save)|(?P<load>load)|(?P<summary>summary))\s*$", re.IGNORECASE
+)
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    Writes the JSON payload of each record as one line to a buffered log file.
+    """
+
+    def __init__(self, filename: str, buffer_size: int = 64 * 1024):
+        super().__init__()
+        self.stream = open(filename, "ab", buffering=buffer_size)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            payload = getattr(record, "payload", None)
+            if payload is None:
+                payload = {"level": record.levelname, "message": record.getMessage()}
+            self.stream.write(orjson.dumps(payload) + b"\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if not self.stream.closed:
+                self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            self.stream.close()
+        super().close()
+
 
 def setup_logging():
     """
     Configure logging to save logs in both JSON format (for file) and readable format (for console).
+    File records are handed to a background listener thread so log I/O stays off the chat path.
+    Only the file serializes the JSON payload; the console shows the short event message, written
+    straight away so it stays in order with the conversation on the terminal.
     """
     logger = logging.getLogger("chatbot")
     logger.setLevel(logging.INFO)
 
     if not logger.handlers:
-        # File handler logs raw JSON strings to a file
-        file_handler = logging.FileHandler("chatbot_logs.json")
-        file_formatter = logging.Formatter("%(message)s")
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
+        # File handler writes each record's payload as a JSON line to a buffered file
+        file_handler = JsonLinesHandler("chatbot_logs.json")
 
         # Console handler logs human-readable logs to the terminal
         console_handler = logging.StreamHandler()
         console_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
         console_handler.setFormatter(console_formatter)
+        # Records logged with extra={"console": False} go to the file only
+        console_handler.addFilter(lambda record: getattr(record, "console", True))
+
+        # File records are only enqueued; the listener runs the file handler in its own thread
+        log_queue = queue.Queue(-1)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
         logger.addHandler(console_handler)
+        listener = logging.handlers.QueueListener(log_queue, file_handler)
+        listener.start()
+        atexit.register(listener.stop)  # Drains the queue before logging flushes the file
 
     return logger
 
@@ -32,19 +127,122 @@ class ChatBot:
     def __init__(self):
         """
         Initialize the chatbot with a new session ID, logging setup, model name, and initial messages.
-        Connect to a locally running Ollama instance via OpenAI-compatible interface.
+        Connect to a locally running Ollama instance via OpenAI-compatible interface and preload the model.
         """
         self.logger = setup_logging()
         self.session_id = str(uuid.uuid4())
         self.model_name = "llama3.2"  # Make sure this matches the model available in Ollama
+        self.summarizer_model = "llama3.2:1b"  # Smaller, cheaper model used only for summaries
+        self.embedding_model = "nomic-embed-text"  # Used to score relevance of past messages
+        self._meta_base = {"session_id": self.session_id, "model": self.model_name}  # Shared by log entries
+        try:
+            # Cached encoder for token budgeting. tiktoken downloads it on first use; to run offline,
+            # point TIKTOKEN_CACHE_DIR at a directory where it was downloaded before
+            self.enc = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            self._log_exception(e)
+            self.enc = None  # Estimate token counts from message length instead
+        self._journal = None  # Conversation file new messages are appended to, once saved
         self.messages = self.create_initial_messages()
-        
-        # Set up OpenAI client to talk to local Ollama instance
+
+        # Set up OpenAI client to talk to local Ollama instance.
+        # The client keeps a pooled HTTP connection, so it is reused across turns.
         self.client = OpenAI(
-            base_url="http://localhost:11434/v1",  # Ollama OpenAI-compatible endpoint
+            base_url=OLLAMA_BASE_URL,
             api_key="ollama"  # Dummy key, Ollama doesn't enforce auth by default
         )
 
+        # Load the model in the background while the banner prints, so the first turn runs hot
+        threading.Thread(target=self._warmup, daemon=True).start()
+
+    def _warmup(self):
+        """
+        Asks Ollama to load the chat model and keep it resident, without generating anything.
+        """
+        try:
+            response = httpx.post(
+                f"{OLLAMA_HOST}/api/generate",
+                json={"model": self.model_name, "prompt": "", "keep_alive": MODEL_KEEP_ALIVE},
+                timeout=120.0  # Loading a model from disk can take a while
+            )
+            response.raise_for_status()
+        except Exception as e:
+            # Logged to the file only, since it would land in the middle of the prompt
+            self._log_exception(e, console=False)
+
+    @property
+    def messages(self) -> Deque[Dict[str, str]]:
+        """
+        The conversation history, bounded to MAX_MESSAGES messages.
+        """
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: Iterable[Dict[str, str]]):
+        self._reset_history(messages)
+        if self._journal is not None:
+            self._rewrite_journal()  # The history was replaced, e.g. by compaction
+
+    def _reset_history(self, messages: Iterable[Dict[str, str]]):
+        """
+        Replaces the conversation history without touching the conversation file.
+
+        Args:
+            messages (Iterable[Dict[str, str]]): The new history.
+        """
+        self._messages = deque(maxlen=MAX_MESSAGES)
+        self._total_tokens = 0
+        for message in messages:
+            self._append(message)
+
+    @property
+    def total_tokens(self) -> int:
+        """
+        The number of tokens in the conversation history, kept up to date as messages change.
+        """
+        return self._total_tokens
+
+    def _append(self, message: Dict[str, str]):
+        """
+        Appends a message, evicting the oldest non-system message if the history is full.
+
+        Args:
+            message (Dict[str, str]): The message to append.
+        """
+        if len(self._messages) == self._messages.maxlen:
+            oldest = next((i for i, m in enumerate(self._messages) if m["role"] != "system"), 0)
+            self._total_tokens -= self._token_count(self._messages[oldest])
+            del self._messages[oldest]
+        self._messages.append(message)
+        self._total_tokens += self._token_count(message)
+
+    def append_message(self, role: str, content: str):
+        """
+        Appends a new message to the conversation history.
+
+        Args:
+            role (str): The role of the message author ("user", "assistant" or "system").
+            content (str): The message text.
+        """
+        message = {"role": role, "content": content}
+        self._append(message)
+        if self._journal is not None:
+            self._journal.write(self._journal_line(message))
+
+    @staticmethod
+    def _journal_line(message: Dict[str, str]) -> bytes:
+        """
+        Serializes a message as a line of the conversation file. Cached fields such as the token
+        count and embedding are left out, since they depend on the encoder and embedding model.
+
+        Args:
+            message (Dict[str, str]): The message to serialize.
+
+        Returns:
+            bytes: The message's role and content as a JSON line.
+        """
+        return orjson.dumps({"role": message["role"], "content": message["content"]}, option=orjson.OPT_APPEND_NEWLINE)
+
     @staticmethod
     def create_initial_messages() -> List[Dict[str, str]]:
         """
@@ -52,112 +250,557 @@ class ChatBot:
         """
         return [{"role": "system", "content": "Hello, how can I help you today?"}]
 
-    def chat(self, user_input: str) -> str:
+    def _log_user_input(self, user_input: str, timestamp: datetime):
         """
-        Sends the user input to the LLM backend, receives a response, and logs the conversation.
+        Logs a message received from the user.
 
         Args:
             user_input (str): The input from the user.
+            timestamp (datetime): When the input was received.
+        """
+        log_entry = {
+            "timestamp": timestamp.isoformat(),
+            "level": "INFO",
+            "type": "user_input",
+            "user_input": user_input,
+            "metadata": self._meta_base
+        }
+        self.logger.info("user_input", extra={"payload": log_entry})
+
+    def _log_model_response(
+        self, full_response: str, response_time: float, tokens_used: Optional[int], timestamp: datetime
+    ):
+        """
+        Logs a complete response from the model.
 
-        Returns:
-            str: The model-generated response or an error message.
+        Args:
+            full_response (str): The model-generated response.
+            response_time (float): Seconds taken to generate the response.
+            tokens_used (Optional[int]): Total tokens reported by the backend, if any.
+            timestamp (datetime): When the response was completed.
         """
-        try:
-            # Log the user's message
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "level": "INFO",
-                "type": "user_input",
-                "user_input": user_input,
-                "metadata": {"session_id": self.session_id, "model": self.model_name}
+        log_entry = {
+            "timestamp": timestamp.isoformat(),
+            "level": "INFO",
+            "type": "model_response",
+            "response_content": full_response,
+            "metadata": {
+                **self._meta_base,
+                "response_time": response_time,
+                "tokens_used": tokens_used
             }
-            self.logger.info(json.dumps(log_entry))
+        }
+        self.logger.info("model_response", extra={"payload": log_entry})
+
+    def _log_exception(self, error: Exception, model: Optional[str] = None, console: bool = True):
+        """
+        Logs an exception raised while talking to the backend, timestamped when it is handled.
+
+        Args:
+            error (Exception): The exception that was raised.
+            model (Optional[str]): The model being called, if not the chat model.
+            console (bool): Whether to show the error on the console as well as in the log file.
+        """
+        error_entry = {
+            "timestamp": datetime.now().isoformat(),
+            "level": "ERROR",
+            "type": "exception",
+            "error_message": str(error),
+            "metadata": self._meta_base if model is None else {**self._meta_base, "model": model}
+        }
+        self.logger.error("exception: %s", error, extra={"payload": error_entry, "console": console})
+
+    def chat(self, user_input: str) -> Iterator[str]:
+        """
+        Sends the user input to the LLM backend, streams the response back, and logs the conversation.
 
-            # Add user message to history
-            self.messages.append({"role": "user", "content": user_input})
+        Args:
+            user_input (str): The input from the user.
+
+        Yields:
+            str: Chunks of the model-generated response as they arrive, or an error message, then a
+            closing newline. The response is logged after the closing newline has been yielded.
+        """
+        # Read the wall clock once per turn; the response timestamp is offset from it by the
+        # monotonic response time instead of reading the clock again
+        turn_start = datetime.now()
+        try:
+            # Log the user's message and add it to history
+            self._log_user_input(user_input, turn_start)
+            self.append_message("user", user_input)
 
-            # Send messages to the model using OpenAI client
-            start_time = datetime.now()
+            # Stream the response so tokens can be shown as soon as they are generated
+            start_time = time.perf_counter()
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=self.messages,
-                stream=False  # Set to True for streaming (requires streaming logic)
+                messages=self._request_messages(),
+                stream=True,
+                stream_options={"include_usage": True}  # Final chunk carries token usage
+            )
+
+            chunks = []
+            usage = None
+            for chunk in response:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if not chunks and content:
+                    # Drop leading whitespace as it arrives, so only trailing whitespace is left to strip
+                    content = content.lstrip()
+                if content:
+                    chunks.append(content)
+                    yield content
+            response_time = time.perf_counter() - start_time
+            yield "\n"  # End the reply on screen before its log line is written
+
+            # rstrip() returns the same string, without copying, when there is nothing to remove
+            full_response = "".join(chunks).rstrip()
+
+            # Log the assistant's full response once streaming has finished
+            self._log_model_response(
+                full_response,
+                response_time,
+                getattr(usage, "total_tokens", None),
+                turn_start + timedelta(seconds=response_time)
             )
-            end_time = datetime.now()
-            response_time = (end_time - start_time).total_seconds()
-
-            # Extract content from the first choice
-            full_response = response.choices[0].message.content.strip()
-
-            # Log the assistant's response
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "level": "INFO",
-                "type": "model_response",
-                "response_content": full_response,
-                "metadata": {
-                    "session_id": self.session_id,
-                    "model": self.model_name,
-                    "response_time": response_time,
-                    "tokens_used": getattr(response.usage, "total_tokens", None)
-                }
-            }
-            self.logger.info(json.dumps(log_entry))
 
             # Append the assistant's response to conversation history
-            self.messages.append({"role": "assistant", "content": full_response})
-            return full_response
+            self.append_message("assistant", full_response)
 
         except Exception as e:
             # Catch-all error logging for exceptions (e.g., connection issues)
-            error_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "level": "ERROR",
-                "type": "exception",
-                "error_message": str(e),
-                "metadata": {
-                    "session_id": self.session_id,
-                    "model": self.model_name,
-                }
-            }
-            self.logger.error(json.dumps(error_entry))
+            self._log_exception(e)
+            yield f"Sorry, something went wrong: {str(e)}\n"
+
+    async def achat(self, user_input: str, pool: "ChatClientPool") -> str:
+        """
+        Async, non-streaming variant of chat() that sends the request through a ChatClientPool
+        shared by many sessions, e.g. when the chatbot is served from a web server. Like the CLI,
+        it compacts the history once it grows over the context budget.
+
+        Args:
+            user_input (str): The input from the user.
+            pool (ChatClientPool): The client pool shared by all sessions talking to the same model.
+
+        Returns:
+            str: The model-generated response or an error message.
+        """
+        turn_start = datetime.now()
+        try:
+            self._log_user_input(user_input, turn_start)
+            self.append_message("user", user_input)
+
+            start_time = time.perf_counter()
+            response = await pool.complete(self._request_messages())
+            response_time = time.perf_counter() - start_time
+
+            full_response = (response.choices[0].message.content or "").strip()
+            self._log_model_response(
+                full_response,
+                response_time,
+                getattr(response.usage, "total_tokens", None),
+                turn_start + timedelta(seconds=response_time)
+            )
+            self.append_message("assistant", full_response)
+
+            # Compaction makes blocking summarizer and embedding calls, so keep it off the event loop
+            if self.total_tokens > CONTEXT_TOKEN_BUDGET:
+                self.messages = await asyncio.to_thread(self.compact_messages)
+            return full_response
+
+        except Exception as e:
+            self._log_exception(e)
             return f"Sorry, something went wrong: {str(e)}"
 
-    def summarize_messages(self) -> List[Dict[str, str]]:
+    def _token_count(self, message: Dict[str, str]) -> int:
         """
-        Summarizes the last few messages to reduce token usage.
+        Returns the number of tokens in a message's content, encoding it only the first time
+        and caching the count on the message under "_n". Without an encoder, the count is
+        estimated at four characters per token.
+
+        Args:
+            message (Dict[str, str]): The message to count.
 
         Returns:
-            List[Dict[str, str]]: A summarized version of the conversation history.
+            int: The number of tokens.
+        """
+        if "_n" not in message:
+            if self.enc is None:
+                message["_n"] = len(message["content"]) // 4
+            else:
+                message["_n"] = len(self.enc.encode(message["content"]))
+        return message["_n"]
+
+    def count_tokens(self, messages: Iterable[Dict[str, str]]) -> int:
+        """
+        Counts the tokens in the content of the given messages.
+
+        Args:
+            messages (Iterable[Dict[str, str]]): The messages to count.
+
+        Returns:
+            int: The total number of tokens.
+        """
+        return sum(self._token_count(m) for m in messages)
+
+    def _request_messages(self) -> List[Dict[str, str]]:
         """
-        summary = "Previous conversation summarized: " + " ".join(
-            [m["content"][:50] + "..." for m in self.messages[-5:]]
+        Returns the history as sent to the model, without cached fields such as embeddings.
+
+        Returns:
+            List[Dict[str, str]]: The role and content of each message.
+        """
+        return [{"role": m["role"], "content": m["content"]} for m in self.messages]
+
+    def _relevance_scores(self, messages: List[Dict[str, str]]) -> Optional[np.ndarray]:
+        """
+        Scores each message by relevance to the latest user message: cosine similarity, rescaled
+        to [0, 1], plus a recency bonus. Embeddings are computed once per message and cached on it
+        under "_emb".
+
+        Args:
+            messages (List[Dict[str, str]]): The messages to score.
+
+        Returns:
+            Optional[np.ndarray]: One score per message, or None if there is no query or the
+            embedding model is unavailable.
+        """
+        if not any(m["role"] == "user" for m in messages):
+            return None
+        missing = [m for m in messages if "_emb" not in m]
+        if missing:
+            try:
+                response = self.client.embeddings.create(
+                    model=self.embedding_model,
+                    input=[m["content"] for m in missing]
+                )
+            except Exception as e:
+                self._log_exception(e, self.embedding_model)
+                return None
+            for message, item in zip(missing, response.data):
+                message["_emb"] = item.embedding
+
+        query = next(m for m in reversed(messages) if m["role"] == "user")
+        embeddings = np.array([m["_emb"] for m in messages], dtype=np.float32)
+        q = np.array(query["_emb"], dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(q)
+        similarity = np.dot(embeddings, q) / np.where(norms == 0, 1, norms)
+        recency = np.arange(len(messages)) / len(messages)
+        return (similarity + 1) / 2 + RECENCY_WEIGHT * recency
+
+    @staticmethod
+    def _weight(message: Dict[str, str]) -> float:
+        """
+        Scores how important a message is to keep in the history.
+
+        Args:
+            message (Dict[str, str]): The message to score.
+
+        Returns:
+            float: The importance weight, infinite for system messages.
+        """
+        if message["role"] == "system":
+            return math.inf
+        weight = 1.0
+        if CODE_OR_ERROR_RE.search(message["content"]):
+            weight += 2.0
+        if message["role"] == "user" and USER_CORRECTION_RE.match(message["content"]):
+            weight += 3.0
+        return weight
+
+    @staticmethod
+    def _turns(messages: List[Dict[str, str]]) -> List[List[int]]:
+        """
+        Groups messages into the units retention keeps or drops together: each system message on
+        its own, and each user message with the replies that follow it.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages to group.
+
+        Returns:
+            List[List[int]]: The indices of the messages in each unit, in order.
+        """
+        turns = []
+        for i, message in enumerate(messages):
+            if message["role"] == "assistant" and turns and messages[turns[-1][0]]["role"] == "user":
+                turns[-1].append(i)
+            else:
+                turns.append([i])
+        return turns
+
+    def _knapsack_retain(
+        self, messages: List[Dict[str, str]], budget: int = CONTEXT_TOKEN_BUDGET
+    ) -> List[Dict[str, str]]:
+        """
+        Keeps the turns that maximize retained importance within the token budget. A user message
+        and its reply are kept or dropped together, so the history keeps alternating.
+        System messages, the first turn and the last two turns are always kept; the rest are
+        added greedily by importance times relevance to the latest user message, per token.
+        Without embeddings, relevance is left out.
+
+        Args:
+            messages (List[Dict[str, str]]): The messages to choose from.
+            budget (int): The maximum number of prompt tokens, before the safety margin.
+
+        Returns:
+            List[Dict[str, str]]: The retained messages, in their original order.
+        """
+        limit = int(budget * (1 - BUDGET_SAFETY_MARGIN))
+        tokens = [self._token_count(m) for m in messages]
+        if sum(tokens) <= limit:
+            return list(messages)
+
+        turns = self._turns(messages)
+        conversation = [t for t, turn in enumerate(turns) if messages[turn[0]]["role"] != "system"]
+        pinned = {t for t, turn in enumerate(turns) if messages[turn[0]]["role"] == "system"}
+        pinned.update(conversation[:1])
+        pinned.update(conversation[-PINNED_RECENT_TURNS:])
+
+        # A turn is worth its messages' combined importance, times its most relevant message
+        relevance = self._relevance_scores(messages)
+        costs = [sum(tokens[i] for i in turn) for turn in turns]
+        scores = [sum(self._weight(messages[i]) for i in turn) / max(cost, 1) for turn, cost in zip(turns, costs)]
+        if relevance is not None:
+            scores = [score * max(relevance[i] for i in turn) for score, turn in zip(scores, turns)]
+
+        kept = set(pinned)
+        used = sum(costs[t] for t in pinned)
+        candidates = sorted(
+            (t for t in range(len(turns)) if t not in pinned),
+            key=lambda t: scores[t],
+            reverse=True
         )
-        return [{"role": "system", "content": summary}] + self.messages[-5:]
+        for t in candidates:
+            if used + costs[t] <= limit:
+                kept.add(t)
+                used += costs[t]
+        return [messages[i] for t in sorted(kept) for i in turns[t]]
 
-    def save_conversation(self, filename: str = "conversation.json"):
+    @staticmethod
+    def _prune_low_signal_lines(content: str) -> str:
         """
-        Saves the current conversation to a JSON file.
+        Removes blank and boilerplate lines from a message, leaving code blocks untouched.
 
         Args:
-            filename (str): The name of the file to save the conversation in.
+            content (str): The message text.
+
+        Returns:
+            str: The text without its low-signal lines.
+        """
+        lines = []
+        in_code = False
+        for line in content.splitlines():
+            if line.lstrip().startswith("```"):
+                in_code = not in_code
+            elif not in_code and LOW_SIGNAL_LINE_RE.match(line):
+                continue
+            lines.append(line)
+        return "\n".join(lines)
+
+    def compact_messages(self) -> List[Dict[str, str]]:
+        """
+        Compacts the history in two tiers. Blank and boilerplate lines outside code blocks are first
+        deleted verbatim from older messages; only if the history is still over budget are the
+        oldest turns summarized.
+
+        Returns:
+            List[Dict[str, str]]: A compacted version of the conversation history.
+        """
+        messages = list(self.messages)
+        older = messages[:-RECENT_MESSAGES_KEPT]
+        recent = messages[-RECENT_MESSAGES_KEPT:]
+
+        # Tier 1: drop blank and boilerplate lines without rewriting anything else
+        pruned = []
+        for message in older:
+            if message["role"] == "system":
+                pruned.append(message)
+                continue
+            content = self._prune_low_signal_lines(message["content"])
+            if not content or content == message["content"]:
+                # Keep the original, with its cached token count and embedding; never drop a whole
+                # message, so user/assistant turns stay paired
+                pruned.append(message)
+            else:
+                pruned.append({"role": message["role"], "content": content})
+        messages = pruned + recent
+
+        # Tier 2: summarize the oldest turns
+        if self.count_tokens(messages) > COMPACTION_TARGET:
+            messages = self.summarize_messages(messages, COMPACTION_TARGET)
+        return messages
+
+    @staticmethod
+    def _is_summary(message: Dict[str, str]) -> bool:
+        """
+        Returns True if the message is a summary written by summarize_messages().
+        """
+        return message["role"] == "system" and message["content"].startswith(SUMMARY_PREFIX)
+
+    def summarize_messages(
+        self, messages: Optional[List[Dict[str, str]]] = None, budget: int = 0
+    ) -> List[Dict[str, str]]:
+        """
+        Summarizes the messages that don't fit within the token budget. Retention first picks the
+        turns kept verbatim: system messages, the first turn, the last two turns and the most
+        important of the rest. Everything else, including earlier summaries, is replaced by a
+        single summary written by the summarizer model.
+
+        Args:
+            messages (Optional[List[Dict[str, str]]]): The messages to summarize, defaults to the current history.
+            budget (int): The token budget the result must fit in; 0 summarizes everything that isn't pinned.
+
+        Returns:
+            List[Dict[str, str]]: A summarized version of the conversation history, or messages
+            itself if nothing was summarized.
+        """
+        if messages is None:
+            messages = list(self.messages)
+        candidates = [m for m in messages if not self._is_summary(m)]
+        kept = self._knapsack_retain(candidates, max(budget - SUMMARY_TOKEN_RESERVE, 0))
+        kept_ids = {id(m) for m in kept}
+        if all(id(m) in kept_ids for m in candidates):
+            return messages  # Everything fits verbatim, so there is nothing new to summarize
+
+        dropped = [m for m in messages if self._is_summary(m) or id(m) not in kept_ids]
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in dropped)
+        try:
+            response = self.client.chat.completions.create(
+                model=self.summarizer_model,
+                messages=[{"role": "user", "content": f"Summarize concisely:\n\n{transcript}"}],
+                max_tokens=SUMMARY_TOKEN_RESERVE,
+                stream=False
+            )
+            summary = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            # Without a budget to meet, keep everything rather than lose the unsummarized turns;
+            # otherwise fall back to retention alone
+            self._log_exception(e, self.summarizer_model)
+            return self._knapsack_retain(messages, budget) if budget else messages
+
+        # The summary goes after the leading system messages, ahead of the retained turns
+        summary_message = {"role": "system", "content": f"{SUMMARY_PREFIX}{summary}"}
+        split = next((i for i, m in enumerate(kept) if m["role"] != "system"), len(kept))
+        return kept[:split] + [summary_message] + kept[split:]
+
+    def _rewrite_journal(self):
+        """
+        Rewrites the conversation file from the current history, one JSON line per message.
         """
-        with open(filename, "w") as f:
-            json.dump(self.messages, f)
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._journal.writelines(self._journal_line(m) for m in self._messages)
+        self._journal.flush()
 
-    def load_conversation(self, filename: str = "conversation.json"):
+    def save_conversation(self, filename: str = CONVERSATION_FILE):
         """
-        Loads conversation history from a file if it exists.
+        Saves the current conversation to a JSON lines file. The first save writes the whole
+        history; after that new messages are appended as they arrive and a save only flushes them.
+
+        Args:
+            filename (str): The name of the file to save the conversation in.
+        """
+        if self._journal is not None and self._journal.name == filename:
+            self._journal.flush()
+            return
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(filename, "wb", buffering=8192)
+        self._rewrite_journal()
+
+    def load_conversation(self, filename: str = CONVERSATION_FILE):
+        """
+        Loads conversation history from a file if it exists, keeping its most recent messages.
+        Only each message's role and content are read, so cached fields are always recomputed.
+        A corrupt file leaves the current history as it is. Loading never writes to a saved file;
+        if the history was being saved to a different file, it stops being saved until the next save.
 
         Args:
             filename (str): The name of the file to load conversation history from.
         """
+        if self._journal is not None:
+            self._journal.flush()  # Make appended messages visible if loading the saved file
         try:
-            with open(filename, "r") as f:
-                self.messages = json.load(f)
+            with open(filename, "rb") as f:
+                messages = [orjson.loads(line) for line in f if line.strip()]
+            messages = [{"role": m["role"], "content": m["content"]} for m in messages]
         except FileNotFoundError:
             print(f"No conversation file found at {filename}")
-            self.messages = self.create_initial_messages()
+            messages = self.create_initial_messages()
+        except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"Could not load conversation from {filename}: {e}")
+            return
+        if self._journal is not None and self._journal.name != filename:
+            self._journal.close()
+            self._journal = None
+        self._reset_history(messages)
+
+    def close(self):
+        """
+        Flushes and closes the conversation file, if the conversation was saved.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+class ChatClientPool:
+    """
+    One async client shared by many sessions, e.g. when the chatbot is served from a web server.
+    Requests reuse its pooled connections and at most max_concurrent run at once, so Ollama's
+    parallel slots stay busy without queueing a backlog of requests on the server.
+    """
+
+    def __init__(self, model_name: str, max_concurrent: int = MAX_CONCURRENT_REQUESTS):
+        self.model_name = model_name
+        self.client = AsyncOpenAI(base_url=OLLAMA_BASE_URL, api_key="ollama")
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def complete(self, messages: List[Dict[str, str]]):
+        """
+        Sends a conversation to the model once a slot is free and waits for its completion.
+
+        Args:
+            messages (List[Dict[str, str]]): The conversation to send to the model.
+
+        Returns:
+            ChatCompletion: The model's completion for this conversation.
+        """
+        async with self._slots:
+            return await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=False
+            )
+
+    async def close(self):
+        """
+        Closes the HTTP client.
+        """
+        await self.client.close()
+
+
+def read_input_lines(lines: queue.Queue):
+    """
+    Reads lines from stdin into a queue until end of input, which is signalled with None, or an
+    exit command. Run on a background thread so the user can type the next prompt while the model
+    is generating. It returns after exit so it isn't blocked reading stdin at interpreter shutdown.
+
+    Args:
+        lines (queue.Queue): The queue to put each line on.
+    """
+    while True:
+        try:
+            line = input()
+        except EOFError:
+            lines.put(None)
+            return
+        lines.put(line)
+        match = COMMAND_RE.match(line)
+        if match and match.lastgroup == "exit":
+            return
 
 
 def main():
@@ -176,33 +819,56 @@ def main():
     print("- 'load': Load conversation")
     print("- 'summary': Summarize conversation")
 
+    def summarize():
+        messages = list(chatbot.messages)
+        summarized = chatbot.summarize_messages(messages)
+        if summarized is messages:
+            return "Nothing was summarized."  # Too little history, or the summarizer failed
+        chatbot.messages = summarized
+
+    # Special commands: the action to run and the confirmation to print, keyed by COMMAND_RE group.
+    # An action can return a message to print instead of the confirmation.
+    commands = {
+        "exit": (lambda: None, "Goodbye! 👋"),
+        "save": (chatbot.save_conversation, "Conversation saved!"),
+        "load": (chatbot.load_conversation, "Conversation loaded!"),
+        "summary": (summarize, "Conversation summarized!"),
+    }
+
+    # Read stdin on a background thread so typing overlaps with the model's generation
+    pending_input = queue.Queue()
+    threading.Thread(target=read_input_lines, args=(pending_input,), daemon=True).start()
+
     while True:
-        user_input = input("\nYou: ")
-
-        if user_input.lower() == 'exit':
-            print("Goodbye! 👋")
-            break
-        elif user_input.lower() == 'save':
-            chatbot.save_conversation()
-            print("Conversation saved!")
-            continue
-        elif user_input.lower() == 'load':
-            chatbot.load_conversation()
-            print("Conversation loaded!")
+        typed_ahead = not pending_input.empty()
+        print("\nYou: ", end="", flush=True)
+        user_input = pending_input.get()
+        if user_input is None:  # End of input (e.g. Ctrl-D) ends the session
+            user_input = "exit"
+        elif typed_ahead:
+            print(user_input)  # Echo input typed while the previous response was streaming
+
+        match = COMMAND_RE.match(user_input)
+        if match:
+            action, confirmation = commands[match.lastgroup]
+            print(action() or confirmation)
+            if match.lastgroup == "exit":
+                chatbot.close()
+                break
             continue
-        elif user_input.lower() == 'summary':
-            chatbot.messages = chatbot.summarize_messages()
-            print("Conversation summarized!")
-            continue
-
-        # Send input to chatbot and display response
-        response = chatbot.chat(user_input)
-        print(f"\nAssistant: {response}")
 
-        # Auto-summarize long conversations
-        if len(chatbot.messages) > 10:
-            chatbot.messages = chatbot.summarize_messages()
-            print("\n(Conversation automatically summarized)")
+        # Send input to chatbot and display the response as it streams in
+        # The prefix is written with the first chunk, after the user input has been logged
+        prefix = "\nAssistant: "
+        for chunk in chatbot.chat(user_input):
+            sys.stdout.write(prefix + chunk)
+            sys.stdout.flush()
+            prefix = ""
+
+        # Keep long conversations within the model's context budget, compacting to COMPACTION_TARGET
+        if chatbot.total_tokens > CONTEXT_TOKEN_BUDGET:
+            chatbot.messages = chatbot.compact_messages()
+            print("\n(Conversation automatically compacted)")
 
 
 # Run chatbot in CLI
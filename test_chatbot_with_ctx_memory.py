@@ -0,0 +1,51 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import chatbot_with_ctx_memory as chatbot_module
+
+
+class FakeCompletions:
+    """
+    Streams a long reply for chat requests and returns a short summary otherwise.
+    """
+
+    def create(self, **kwargs):
+        if kwargs.get("stream"):
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="word " * 300))], usage=None),
+                SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=300)),
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="A summary."))])
+
+
+class FakeEmbeddings:
+    def create(self, **kwargs):
+        raise ConnectionError("embedding model unavailable")
+
+
+class CompactionTest(unittest.TestCase):
+    def setUp(self):
+        with mock.patch.object(chatbot_module.threading, "Thread"):  # Skip the model warm-up
+            self.chatbot = chatbot_module.ChatBot()
+        self.chatbot.client = SimpleNamespace(
+            chat=SimpleNamespace(completions=FakeCompletions()), embeddings=FakeEmbeddings()
+        )
+
+    def test_compaction_keeps_turns_paired(self):
+        compactions = 0
+        for turn in range(12):
+            "".join(self.chatbot.chat(f"question {turn}"))
+            if self.chatbot.total_tokens > chatbot_module.CONTEXT_TOKEN_BUDGET:
+                self.chatbot.messages = self.chatbot.compact_messages()
+                compactions += 1
+
+        self.assertGreaterEqual(compactions, 2)
+        roles = [m["role"] for m in self.chatbot.messages if m["role"] != "system"]
+        self.assertEqual(roles, ["user", "assistant"] * (len(roles) // 2))
+        self.assertEqual(self.chatbot.messages[-2]["content"], "question 11")
+        self.assertTrue(any(m["content"] == "question 0" for m in self.chatbot.messages))
+
+
+if __name__ == "__main__":
+    unittest.main()